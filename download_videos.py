@@ -6,222 +6,299 @@ Supports concurrent downloads for faster processing
 """
 
 import os
-import csv
-import subprocess
 import sys
 import argparse
+import asyncio
+import itertools
+import logging
+import pickle
+import queue
+import random
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+import pandas as pd
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError, sanitize_filename
 
 # Configuration
 CSV_FILE = "Videos/Video_url.csv"
-OUTPUT_DIR = "Videos/Trim_Videos/raw_video"
+OUTPUT_DIR = Path("Videos/Trim_Videos/raw_video")
 MAX_RETRIES = 3
 DEFAULT_MAX_WORKERS = 8  # Default number of concurrent downloads
+CHUNK_SIZE = 1 << 16  # 64 KB streaming chunks
+DOWNLOAD_TIMEOUT = 1800  # 30 minutes timeout per video
+PROBE_TIMEOUT = 5  # Seconds for the pre-flight HEAD request
+SEGMENTS_PER_FILE = 4  # Parallel range GETs per video when the server allows
+SEGMENT_MIN_SIZE = SEGMENTS_PER_FILE * (1 << 20)  # Don't split files under 4 MB
+CACHE_VERSION = 2  # Bump when the cached video-record format changes
 
-# Thread-safe counters
-progress_lock = Lock()
-success_count = 0
-skip_count = 0
-fail_count = 0
-completed_count = 0
+class _QuietLogger:
+    """Null sink for yt-dlp output; errors still surface as DownloadError"""
+    def debug(self, msg):
+        pass
 
-def check_ytdlp():
-    """Check if yt-dlp is installed"""
-    try:
-        subprocess.run(["yt-dlp", "--version"], capture_output=True, check=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+    def warning(self, msg):
+        pass
 
-def install_ytdlp():
-    """Install yt-dlp if not available"""
-    print("yt-dlp not found. Installing...")
-    try:
-        # Try pip3 first, then pip
-        for pip_cmd in ["pip3", "pip"]:
-            try:
-                subprocess.run([pip_cmd, "install", "yt-dlp"], check=True, capture_output=True)
-                print("yt-dlp installed successfully!")
-                return True
-            except (subprocess.CalledProcessError, FileNotFoundError):
-                continue
-        
-        # Fallback to python -m pip
-        subprocess.run([sys.executable, "-m", "pip", "install", "yt-dlp"], check=True)
-        print("yt-dlp installed successfully!")
-        return True
-    except subprocess.CalledProcessError:
-        print("Failed to install yt-dlp. Please install it manually:")
-        print("  pip3 install yt-dlp")
-        print("  or")
-        print("  pip install yt-dlp")
-        return False
+    def error(self, msg):
+        pass
+
+# Shared yt-dlp options; metadata extraction only, aiohttp moves the bytes
+YDL_OPTS = {
+    'format': 'best[ext=mp4]/best',  # Prefer mp4, fallback to best available
+    'noplaylist': True,
+    'quiet': True,  # Reduce output noise in concurrent mode
+    'no_warnings': True,
+    'retries': MAX_RETRIES,
+    'logger': _QuietLogger(),  # Keep extractor workers off stdout/stderr
+}
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.flv')
 
 def create_output_dir():
     """Create output directory if it doesn't exist"""
-    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
-    print(f"Output directory: {os.path.abspath(OUTPUT_DIR)}")
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    print(f"Output directory: {OUTPUT_DIR.resolve()}")
 
 def read_video_urls():
-    """Read video URLs from CSV file"""
-    videos = []
+    """Read video URLs from CSV file, caching the parsed list between runs"""
+    cache_path = Path(CSV_FILE + '.cache')
     try:
-        # Use utf-8-sig to handle BOM (Byte Order Mark)
-        with open(CSV_FILE, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # Handle both 'Title' and possible variations
-                title_key = 'Title' if 'Title' in row else 'title'
-                url_key = 'URL' if 'URL' in row else 'url'
-                
-                if title_key not in row or url_key not in row:
-                    print(f"Warning: Skipping row with missing columns: {row}")
-                    continue
-                
-                title = row[title_key].strip()
-                url = row[url_key].strip()
-                
-                # Skip empty rows
-                if not title or not url:
-                    continue
-                
-                # Skip privacy URLs
-                if url.lower() == "privacy url" or not url.startswith("http"):
-                    continue
-                
-                videos.append({
-                    'title': title,
-                    'url': url
-                })
-        return videos
+        csv_mtime = os.stat(CSV_FILE).st_mtime
     except FileNotFoundError:
         print(f"Error: {CSV_FILE} not found!")
         sys.exit(1)
+
+    # Reuse the sidecar cache if the CSV hasn't changed since it was written
+    if cache_path.exists():
+        try:
+            cached = pickle.loads(cache_path.read_bytes())
+            if cached.get('mtime') == csv_mtime and cached.get('version') == CACHE_VERSION:
+                return cached['videos']
+        except Exception:
+            pass  # Stale or corrupt cache; fall through and re-parse
+
+    try:
+        # Use utf-8-sig to handle BOM (Byte Order Mark); pyarrow's engine
+        # memory-maps the file and tokenizes it in a C++ thread pool
+        try:
+            df = pd.read_csv(CSV_FILE, encoding='utf-8-sig', engine='pyarrow')
+        except ImportError:
+            df = pd.read_csv(CSV_FILE, encoding='utf-8-sig')
+        # Handle both 'Title'/'URL' and lowercase variations
+        df.columns = df.columns.str.strip().str.lower()
+        if 'title' not in df.columns or 'url' not in df.columns:
+            print(f"Error: {CSV_FILE} is missing the Title/URL columns!")
+            sys.exit(1)
+
+        df = df[['title', 'url']].dropna()
+        df['title'] = df['title'].str.strip()
+        df['url'] = df['url'].str.strip()
+
+        # Drop empty rows and privacy URLs in one vectorized pass
+        mask = ((df['title'] != '')
+                & df['url'].str.startswith('http')
+                & (df['url'].str.lower() != 'privacy url'))
+        # Re-collected sheets can repeat URLs; keep the first occurrence only
+        df = df.loc[mask].drop_duplicates(subset='url')
+
+        # Titles can contain characters the filesystem won't take (/ : ?);
+        # fix the on-disk stem once here so existence checks and output
+        # paths always agree with what actually gets written
+        df = df.assign(stem=df['title'].map(sanitize_filename))
+        videos = df.to_dict('records')
+
+        # Best-effort cache write keyed by the CSV's mtime
+        try:
+            cache_path.write_bytes(pickle.dumps(
+                {'mtime': csv_mtime, 'version': CACHE_VERSION, 'videos': videos}))
+        except OSError:
+            pass
+        return videos
     except Exception as e:
         print(f"Error reading CSV file: {e}")
         import traceback
         traceback.print_exc()
         sys.exit(1)
 
-def video_exists(title):
-    """Check if video file already exists"""
-    # Check for common video extensions
-    extensions = ['.mp4', '.mkv', '.webm', '.flv']
-    for ext in extensions:
-        video_path = os.path.join(OUTPUT_DIR, f"{title}{ext}")
-        if os.path.exists(video_path):
-            return True
-    return False
+def index_existing_videos():
+    """Index already-downloaded file stems with a single directory scan"""
+    with os.scandir(OUTPUT_DIR) as entries:
+        return {Path(entry.name).stem for entry in entries
+                if entry.name.endswith(VIDEO_EXTENSIONS)}
 
-def download_video(title, url, total_videos, retry_count=0):
-    """Download a single video using yt-dlp"""
-    global success_count, fail_count, completed_count
-    
-    output_path = os.path.join(OUTPUT_DIR, f"{title}.%(ext)s")
-    
-    # yt-dlp command with options
-    cmd = [
-        "yt-dlp",
-        "-o", output_path,
-        "--no-playlist",
-        "--format", "best[ext=mp4]/best",  # Prefer mp4, fallback to best available
-        "--no-warnings",
-        "--quiet",  # Reduce output noise in concurrent mode
-        url
-    ]
-    
+def extract_video_info(url):
+    """Resolve the direct media URL and extension with yt-dlp (blocking)"""
     try:
-        with progress_lock:
-            current = completed_count + 1
-        print(f"[{current}/{total_videos}] Downloading: {title}", flush=True)
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=1800  # 30 minutes timeout per video
-        )
-        
-        # Find the actual downloaded file
-        downloaded_file = None
-        for ext in ['.mp4', '.mkv', '.webm', '.flv']:
-            potential_file = os.path.join(OUTPUT_DIR, f"{title}{ext}")
-            if os.path.exists(potential_file):
-                downloaded_file = potential_file
-                break
-        
-        if downloaded_file:
-            with progress_lock:
-                success_count += 1
-                completed_count += 1
-            print(f"[{current}/{total_videos}] ✓ Successfully downloaded: {title}", flush=True)
-            return True
-        else:
-            with progress_lock:
-                fail_count += 1
-                completed_count += 1
-            print(f"[{current}/{total_videos}] ✗ File not found after download: {title}", flush=True)
-            return False
-            
-    except subprocess.TimeoutExpired:
-        with progress_lock:
-            current = completed_count + 1
-        if retry_count < MAX_RETRIES:
-            print(f"[{current}/{total_videos}] ⚠ Timeout, retry {retry_count + 1}/{MAX_RETRIES} for {title}", flush=True)
-            return download_video(title, url, total_videos, retry_count + 1)
-        else:
-            with progress_lock:
-                fail_count += 1
-                completed_count += 1
-            print(f"[{current}/{total_videos}] ✗ Timeout after {MAX_RETRIES} retries: {title}", flush=True)
-            return False
-    except subprocess.CalledProcessError as e:
-        with progress_lock:
-            current = completed_count + 1
-        if retry_count < MAX_RETRIES:
-            print(f"[{current}/{total_videos}] ⚠ Retry {retry_count + 1}/{MAX_RETRIES} for {title}", flush=True)
-            return download_video(title, url, total_videos, retry_count + 1)
+        with YoutubeDL(YDL_OPTS) as ydl:
+            return ydl.extract_info(url, download=False)
+    except DownloadError as e:
+        # DownloadError carries exc_info (a traceback and logger reference)
+        # that cannot pickle back across the process boundary; re-raise with
+        # just the message so the parent's retry handling sees the real error
+        raise DownloadError(str(e)) from None
+
+async def probe(session, url):
+    """Cheap HEAD pre-flight; False means the link is clearly dead"""
+    try:
+        async with session.head(url, allow_redirects=True,
+                                timeout=aiohttp.ClientTimeout(total=PROBE_TIMEOUT)) as response:
+            return response.status < 400
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return False
+
+async def _fetch_range(session, media_url, path, headers, start, end):
+    """Fetch one byte range and write it at its offset in the output file"""
+    range_headers = dict(headers or {})
+    range_headers['Range'] = f'bytes={start}-{end}'
+    async with session.get(media_url, headers=range_headers) as response:
+        response.raise_for_status()
+        if response.status != 206:
+            # A server can advertise Accept-Ranges yet answer 200 with the
+            # full body; writing that at four offsets would corrupt the file
+            raise aiohttp.ClientResponseError(
+                response.request_info, response.history, status=response.status,
+                message='expected 206 Partial Content for range request',
+                headers=response.headers)
+        with open(path, 'r+b') as f:
+            f.seek(start)
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                f.write(chunk)
+
+async def fetch(session, media_url, path, headers=None):
+    """Stream the media URL to disk, splitting large files into parallel
+    range GETs when the server supports them"""
+    size = 0
+    accepts_ranges = False
+    try:
+        async with session.head(media_url, headers=headers, allow_redirects=True) as response:
+            if response.status < 400:
+                size = int(response.headers.get('Content-Length', 0))
+                accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass  # Fall back to a single sequential GET
+
+    # Download into a .part sidecar and rename into place only once the
+    # transfer completes, so an interrupted run never leaves a partial file
+    # at the final path for the skip filter to index as already downloaded
+    part_path = path.with_name(path.name + '.part')
+    try:
+        if accepts_ranges and size >= SEGMENT_MIN_SIZE:
+            # Preallocate the file, then let each segment write at its own offset;
+            # the session's connection pool caps total sockets across videos
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+            segment = size // SEGMENTS_PER_FILE
+            bounds = [(i * segment, (i + 1) * segment - 1 if i < SEGMENTS_PER_FILE - 1 else size - 1)
+                      for i in range(SEGMENTS_PER_FILE)]
+            try:
+                # TaskGroup cancels the sibling ranges when one fails, so no
+                # segment keeps writing while the retry loop reopens the file
+                async with asyncio.TaskGroup() as tg:
+                    for start, end in bounds:
+                        tg.create_task(_fetch_range(session, media_url, part_path,
+                                                    headers, start, end))
+            except ExceptionGroup as eg:
+                # Re-raise one underlying error so the caller's retry
+                # handling sees the usual exception types
+                raise eg.exceptions[0] from None
         else:
-            with progress_lock:
-                fail_count += 1
-                completed_count += 1
-            error_msg = e.stderr[:100] if e.stderr else str(e)
-            print(f"[{current}/{total_videos}] ✗ Failed to download {title}: {error_msg}", flush=True)
+            async with session.get(media_url, headers=headers) as response:
+                response.raise_for_status()
+                with open(part_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+        os.replace(part_path, path)
+    except BaseException:
+        # BaseException so cancellation and Ctrl-C also clean up the sidecar
+        part_path.unlink(missing_ok=True)
+        raise
+
+async def download_video(session, executor, title, stem, url, current, total_videos):
+    """Download a single video: yt-dlp metadata + aiohttp streaming"""
+    loop = asyncio.get_running_loop()
+    logging.info(f"[{current}/{total_videos}] Downloading: {title}")
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            # yt-dlp's extract_info is blocking and Python-heavy; run it in the
+            # process pool so concurrent extractions don't serialize on the GIL
+            info = await loop.run_in_executor(executor, extract_video_info, url)
+
+            # The exact output path is known up front from the resolved extension,
+            # so no post-download filesystem scan is needed: fetch either wrote
+            # this path or raised
+            ext = info.get('ext', 'mp4')
+            output_path = OUTPUT_DIR / f"{stem}.{ext}"
+            await fetch(session, info['url'], output_path, headers=info.get('http_headers'))
+
+            logging.info(f"[{current}/{total_videos}] ✓ Successfully downloaded: {title}")
+            return True
+
+        except (DownloadError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == MAX_RETRIES:
+                error_msg = str(e)[:100]
+                logging.info(f"[{current}/{total_videos}] ✗ Failed to download {title}: {error_msg}")
+                return False
+            # Exponential backoff with jitter so retries don't re-hit the
+            # server in lockstep
+            logging.info(f"[{current}/{total_videos}] ⚠ Retry {attempt + 1}/{MAX_RETRIES} for {title}")
+            await asyncio.sleep(min(60, 2 ** attempt) + random.random())
+        except Exception as e:
+            logging.info(f"[{current}/{total_videos}] ✗ Error downloading {title}: {e}")
             return False
-    except Exception as e:
-        with progress_lock:
-            current = completed_count + 1
-            fail_count += 1
-            completed_count += 1
-        print(f"[{current}/{total_videos}] ✗ Error downloading {title}: {e}", flush=True)
-        return False
+    return False
 
-def download_video_wrapper(video_info, total_videos):
-    """Wrapper function for concurrent downloads"""
+async def download_video_wrapper(session, executor, counter, video_info, total_videos):
+    """Wrapper coroutine for concurrent downloads"""
     title = video_info['title']
+    stem = video_info['stem']
     url = video_info['url']
-    
-    # Check if video already exists
-    if video_exists(title):
-        global skip_count, completed_count
-        with progress_lock:
-            skip_count += 1
-            completed_count += 1
-            current = completed_count
-        print(f"[{current}/{total_videos}] ⏭ Skipping {title} (already exists)", flush=True)
-        return {'title': title, 'status': 'skipped'}
-    
-    # Download video
-    success = download_video(title, url, total_videos)
+    current = next(counter)
+
+    # Download video; already-downloaded titles were filtered out in main
+    success = await download_video(session, executor, title, stem, url, current, total_videos)
     return {'title': title, 'status': 'success' if success else 'failed'}
 
+async def _run(videos, max_workers):
+    """Download all videos with at most max_workers concurrent transfers"""
+    # No point holding slots, sockets, or worker processes beyond the
+    # number of videos actually queued
+    workers = max(1, min(max_workers, len(videos)))
+    semaphore = asyncio.Semaphore(workers)
+    # Progress numbering is owned by this run, not module state; next() on
+    # itertools.count is atomic even on free-threaded builds
+    counter = itertools.count(1)
+    connector = aiohttp.TCPConnector(limit=workers)
+    timeout = aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)
+
+    with ProcessPoolExecutor(max_workers=min(workers, os.cpu_count() or 1)) as executor:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            # Pre-flight: header-only round-trips weed out dead links before
+            # any of them pays extractor cost and MAX_RETRIES attempts
+            async def bounded_probe(video):
+                async with semaphore:
+                    return await probe(session, video['url'])
+
+            alive = await asyncio.gather(*[bounded_probe(video) for video in videos])
+            dead = [{'title': video['title'], 'status': 'failed'}
+                    for video, ok in zip(videos, alive) if not ok]
+            for result in dead:
+                logging.info(f"✗ Skipping dead link: {result['title']}")
+            videos = [video for video, ok in zip(videos, alive) if ok]
+
+            async def bounded(video):
+                async with semaphore:
+                    return await download_video_wrapper(session, executor, counter, video, len(videos))
+
+            return dead + list(await asyncio.gather(*[bounded(video) for video in videos]))
+
 def main():
     """Main function"""
-    global success_count, skip_count, fail_count, completed_count
-    
     # Parse command line arguments
     parser = argparse.ArgumentParser(
         description='Download videos from YouTube URLs listed in Video_url.csv',
@@ -240,72 +317,64 @@ Examples:
         help=f'Number of concurrent downloads (default: {DEFAULT_MAX_WORKERS})'
     )
     args = parser.parse_args()
-    
+
     max_workers = args.workers
     if max_workers < 1:
         print("Error: Number of workers must be at least 1")
         sys.exit(1)
-    
+
+    # Progress lines only enqueue a record here; a single listener thread
+    # does the blocking terminal writes, so workers never stall on stdout.
+    # basicConfig hands its format to the QueueHandler, whose prepare() bakes
+    # the final string into the record before the listener ever sees it, so
+    # the bare-message format must be set there rather than on the listener.
+    log_queue = queue.SimpleQueue()
+    terminal_handler = logging.StreamHandler(sys.stdout)
+    listener = QueueListener(log_queue, terminal_handler)
+    logging.basicConfig(level=logging.INFO, format="%(message)s",
+                        handlers=[QueueHandler(log_queue)], force=True)
+    listener.start()
+
     print("=" * 60)
     print("SmartHome-Bench Video Downloader")
     print("=" * 60)
     print(f"Concurrent downloads: {max_workers}")
-    
-    # Check and install yt-dlp
-    if not check_ytdlp():
-        if not install_ytdlp():
-            sys.exit(1)
-    
-    # Create output directory
+
+    # Create output directory and index what is already downloaded
     create_output_dir()
-    
+    existing = index_existing_videos()
+
     # Read video URLs
     print(f"\nReading video URLs from {CSV_FILE}...")
     videos = read_video_urls()
-    print(f"Found {len(videos)} videos to download\n")
-    
-    # Reset counters
-    success_count = 0
-    skip_count = 0
-    fail_count = 0
-    completed_count = 0
-    
-    # Download videos concurrently
-    if max_workers == 1:
-        # Sequential download (original behavior)
-        print("Downloading videos sequentially...\n")
-        for video in videos:
-            result = download_video_wrapper(video, len(videos))
-    else:
-        # Concurrent download
-        print(f"Downloading videos with {max_workers} concurrent workers...\n")
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all download tasks
-            future_to_video = {
-                executor.submit(download_video_wrapper, video, len(videos)): video
-                for video in videos
-            }
-            
-            # Process completed downloads
-            for future in as_completed(future_to_video):
-                try:
-                    result = future.result()
-                except Exception as e:
-                    video = future_to_video[future]
-                    with progress_lock:
-                        fail_count += 1
-                        completed_count += 1
-                    print(f"Exception downloading {video['title']}: {e}")
-    
+    print(f"Found {len(videos)} videos to download")
+
+    # Filter out already-downloaded videos so pool slots and connection
+    # budget go straight to real work
+    pending = [video for video in videos if video['stem'] not in existing]
+    skip_count = len(videos) - len(pending)
+    if skip_count:
+        print(f"Skipping {skip_count} videos that already exist")
+    print()
+
+    # Download videos concurrently on a single event loop
+    print(f"Downloading videos with {max_workers} concurrent transfers...\n")
+    try:
+        results = asyncio.run(_run(pending, max_workers))
+    finally:
+        listener.stop()  # Drain queued progress lines before the summary
+
+    # Aggregate worker results in the parent
+    tally = Counter(r['status'] for r in results)
+
     # Summary
     print("\n" + "=" * 60)
     print("Download Summary:")
-    print(f"  Successfully downloaded: {success_count}")
+    print(f"  Successfully downloaded: {tally['success']}")
     print(f"  Skipped (already exists): {skip_count}")
-    print(f"  Failed: {fail_count}")
+    print(f"  Failed: {tally['failed']}")
     print(f"  Total: {len(videos)}")
     print("=" * 60)
 
 if __name__ == "__main__":
     main()
-
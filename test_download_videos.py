@@ -0,0 +1,46 @@
+"""
+Regression tests for download_videos.py
+Covers the process-pool exception path: extraction failures must cross
+the worker boundary as DownloadError and go through the retry loop
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from yt_dlp.utils import DownloadError
+
+import download_videos
+
+
+def test_extraction_failure_crosses_process_pool_as_download_error():
+    # .invalid is reserved and never resolves, so extraction fails without
+    # real network; the parent must see DownloadError, not a PicklingError
+    # from the unpicklable exc_info yt-dlp attaches
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(download_videos.extract_video_info,
+                             'https://no-such-host.invalid/video')
+        with pytest.raises(DownloadError):
+            future.result()
+
+
+def test_extraction_failure_is_retried(monkeypatch):
+    calls = []
+
+    def failing_extract(url):
+        calls.append(url)
+        raise DownloadError('simulated extraction failure')
+
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(download_videos, 'extract_video_info', failing_extract)
+    monkeypatch.setattr(download_videos.asyncio, 'sleep', no_sleep)
+
+    # session is never touched because extraction fails first; executor=None
+    # uses the default thread executor
+    result = asyncio.run(download_videos.download_video(
+        None, None, 'some title', 'some title', 'https://example.com/video', 1, 1))
+
+    assert result is False
+    assert len(calls) == download_videos.MAX_RETRIES + 1